@@ -1,15 +1,26 @@
 import asyncio
-import json
+import heapq
 import os
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, TypedDict, cast
+import sys
+import time
 from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
 
 import aiohttp
+import orjson
 import uvicorn
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from vakula_common import HttpClient, StationState, module_name, setup_logger
+from fastapi.responses import ORJSONResponse
+from vakula_common import HttpClient, module_name, post_json, setup_logger
 
 log = setup_logger("BROKER")
 HTTP_CLIENT = HttpClient()
@@ -17,19 +28,33 @@ HTTP_CLIENT = HttpClient()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Start background broadcaster and set up shared HTTP session.
-    # The broadcaster handles stale checks + WebSocket pushes.
+    # Start background tasks and set up shared HTTP session.
+    # The stale loop handles offline checks, the broadcaster WebSocket pushes.
     HTTP_CLIENT.create_session(10)
-    task = asyncio.create_task(stale_broadcast_loop())
+    tasks = [
+        asyncio.create_task(stale_broadcast_loop()),
+        asyncio.create_task(broadcaster_loop()),
+        asyncio.create_task(alert_sender_loop()),
+    ]
     try:
         yield
     finally:
-        task.cancel()
-        await asyncio.gather(task, return_exceptions=True)
-        await HTTP_CLIENT.session.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.wait_for(_drain_alerts(), ALERT_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            log.warning(f"Dropped {alert_queue.qsize()} alerts on shutdown")
+        finally:
+            await HTTP_CLIENT.session.close()
 
 
-app = FastAPI(title="Vakula Broker", lifespan=lifespan)
+app = FastAPI(
+    title="Vakula Broker",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,36 +65,113 @@ app.add_middleware(
 )
 
 
-class StationRecordBase(TypedDict):
-    id: int
-    name: str
-    modules: dict[int, dict[str, Any]]
-
-
-class StationRecord(StationRecordBase, total=False):
-    last_update: datetime
-    lat: float | None
-    lon: float | None
-    last_event: str | None
-    status: str
-    last_notified_status: str
+@dataclass
+class StationTable:
+    # Column-oriented station store: one list per field, indexed by row.
+    # `rows` maps a station id to its row so lookups stay O(1).
+    rows: Dict[int, int] = field(default_factory=dict)
+    ids: List[int] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    lats: List[float | None] = field(default_factory=list)
+    lons: List[float | None] = field(default_factory=list)
+    modules: List[Dict[int, Dict[str, Any]]] = field(default_factory=list)
+    last_update_ns: List[int] = field(default_factory=list)
+    worst_health: List[int] = field(default_factory=list)
+    worst_module: List[int | None] = field(default_factory=list)
+    last_event: List[str | None] = field(default_factory=list)
+    status: List[int | None] = field(default_factory=list)
+    last_notified_status: List[int | None] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_for(self, station_id: int, name: str) -> int:
+        # Return the row for a station, appending an empty one if it's new.
+        row = self.rows.get(station_id)
+        if row is not None:
+            return row
+        row = len(self.ids)
+        self.rows[station_id] = row
+        self.ids.append(station_id)
+        self.names.append(name)
+        self.lats.append(None)
+        self.lons.append(None)
+        self.modules.append({})
+        self.last_update_ns.append(0)
+        self.worst_health.append(100)
+        self.worst_module.append(None)
+        self.last_event.append(None)
+        self.status.append(None)
+        self.last_notified_status.append(None)
+        return row
+
+
+@dataclass
+class ClientConn:
+    # A connected WebSocket client and its single-slot outgoing queue.
+    websocket: WebSocket
+    queue: asyncio.Queue[bytes] = field(
+        default_factory=lambda: asyncio.Queue(maxsize=1)
+    )
+    sender: asyncio.Task[None] | None = None
 
 
-stations: Dict[int, StationRecord] = {}
+stations = StationTable()
+# Bumped whenever the broadcast state changes; keys the encoded-state cache.
+world_version = 0
+_state_cache: tuple[int, bytes] | None = None
+# Bumped when a station is added or its name/coordinates change.
+static_version = 0
+_static_cache: tuple[int, bytes] | None = None
 
 state_lock = asyncio.Lock()
-connections: List[WebSocket] = []
+state_dirty = asyncio.Event()
+# Min-heap of (stale deadline ns, station id); may hold superseded entries.
+stale_heap: List[tuple[int, int]] = []
+# Stations with an entry in stale_heap; each station has at most one.
+stale_scheduled: set[int] = set()
+stale_wakeup = asyncio.Event()
+# Alerts waiting for the telegram sender; ingest never awaits the send.
+alert_queue: asyncio.Queue[str] = asyncio.Queue(maxsize=256)
+# Keyed by id(websocket) so disconnects are removed in O(1).
+connections: Dict[int, ClientConn] = {}
 STALE_TIMEOUT = int(os.environ["BROKER_STALE_SECONDS"])
+STALE_TIMEOUT_NS = STALE_TIMEOUT * 1_000_000_000
 TELEGRAM_URL = os.environ["TELEGRAM_URL"]
-ALERT_STATUSES = {"warn", "bad", "critical", "offline"}
+# Statuses are small int codes; labels are only looked up for the wire.
+STATUS_OK, STATUS_WARN, STATUS_BAD, STATUS_CRITICAL, STATUS_OFFLINE = range(5)
+STATUS_NAMES = ("ok", "warn", "bad", "critical", "offline")
+# Bit set of the status codes that trigger an alert.
+ALERT_MASK = (
+    (1 << STATUS_WARN)
+    | (1 << STATUS_BAD)
+    | (1 << STATUS_CRITICAL)
+    | (1 << STATUS_OFFLINE)
+)
+SEND_TIMEOUT = 2.0
+BROADCAST_COALESCE_SECONDS = 0.05
+# Upper bound on flushing queued alerts at shutdown.
+ALERT_DRAIN_SECONDS = 5.0
+# Above this many stations the world state is built in a worker thread.
+OFFLOAD_THRESHOLD = 64
 
 
-def _evaluate_station(
-    station: StationRecord, now: datetime
-) -> tuple[str, int | None, int, bool]:
-    # Determine a station's status based on module health and staleness.
-    # Returns: status label, worst module name, worst health, is_stale.
-    modules = station.get("modules", {})
+def _status_code(worst_health: int, stale: bool) -> int:
+    # Map worst module health and staleness to a status code.
+    if stale:
+        return STATUS_OFFLINE
+    if worst_health <= 20:
+        return STATUS_CRITICAL
+    if worst_health <= 50:
+        return STATUS_BAD
+    if worst_health <= 80:
+        return STATUS_WARN
+    return STATUS_OK
+
+
+def _worst_module(modules: Dict[int, Dict[str, Any]]) -> tuple[int | None, int]:
+    # Find the module with the lowest health.
+    # Returns: worst module id (None when all are healthy), worst health.
     worst_health = 100
     worst_name: int | None = None
     for name, module_state in modules.items():
@@ -77,23 +179,7 @@ def _evaluate_station(
         if health < worst_health:
             worst_health = health
             worst_name = name
-
-    last_update: datetime | None = station.get("last_update")
-    stale = False
-    if last_update is not None:
-        stale = now - last_update > timedelta(seconds=STALE_TIMEOUT)
-
-    status = "ok"
-    if stale:
-        status = "offline"
-    elif worst_health <= 20:
-        status = "critical"
-    elif worst_health <= 50:
-        status = "bad"
-    elif worst_health <= 80:
-        status = "warn"
-
-    return status, worst_name, worst_health, stale
+    return worst_name, worst_health
 
 
 async def _send_telegram_message(message: str) -> None:
@@ -103,21 +189,44 @@ async def _send_telegram_message(message: str) -> None:
         return
     payload = {"message": message}
     try:
-        async with HTTP_CLIENT.session.post(
-            f"{TELEGRAM_URL}/api/send", json=payload
+        async with post_json(
+            HTTP_CLIENT.session, f"{TELEGRAM_URL}/api/send", payload
         ) as resp:
             resp.raise_for_status()
-    except aiohttp.ClientError as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         log.warning(f"Failed to notify telegram: {e!r}")
 
 
+def _queue_alert(message: str) -> None:
+    # Hand an alert to the sender task; drop it if telegram is backed up.
+    try:
+        alert_queue.put_nowait(message)
+    except asyncio.QueueFull:
+        log.warning(f"Alert queue full, dropping: {message}")
+
+
+async def alert_sender_loop() -> None:
+    # Single consumer for alerts, so slow telegram calls stay off ingest.
+    while True:
+        message = await alert_queue.get()
+        try:
+            await _send_telegram_message(message)
+        except Exception as e:
+            log.warning(f"Alert sender error: {e!r}")
+
+
+async def _drain_alerts() -> None:
+    # Send whatever is still queued; bounded by the caller on shutdown.
+    while not alert_queue.empty():
+        await _send_telegram_message(alert_queue.get_nowait())
+
+
 def _format_alert_message(
-    station: StationRecord, status: str, worst_name: int | None, worst_health: int
+    name: str, status: int, worst_name: int | None, worst_health: int
 ) -> str:
     # Build a short, human-friendly alert message.
     # Used for Telegram notifications.
-    name = station.get("name", f"Station {station.get('id', '?')}")
-    if status == "offline":
+    if status == STATUS_OFFLINE:
         module_info = f"no updates for {STALE_TIMEOUT}s"
     elif worst_name is not None:
         try:
@@ -127,139 +236,306 @@ def _format_alert_message(
         module_info = f"{module_label} {worst_health}%"
     else:
         module_info = "no module data"
-    return f"{name}: {status.upper()} ({module_info})"
+    return f"{name}: {STATUS_NAMES[status].upper()} ({module_info})"
+
+
+def _apply_status(row: int, status: int) -> str | None:
+    # Store a station's new status and return an alert message
+    # if it just crossed into an alert status we haven't reported yet.
+    previous_status = stations.status[row]
+    stations.status[row] = status
+    if (
+        (ALERT_MASK >> status) & 1
+        and status != previous_status
+        and stations.last_notified_status[row] != status
+    ):
+        stations.last_notified_status[row] = status
+        return _format_alert_message(
+            stations.names[row],
+            status,
+            stations.worst_module[row],
+            stations.worst_health[row],
+        )
+    return None
 
 
-def compute_world_state() -> Dict[str, Any]:
-    # Build the full state payload for the frontend.
-    # Includes computed status and overall health for each station.
-    now = datetime.now(timezone.utc)
-    items: List[Dict[str, Any]] = []
-    for station_id, station in stations.items():
-        status, _, worst, stale = _evaluate_station(station, now)
-        modules = station.get("modules", {})
+def _encode(state: Dict[str, Any]) -> bytes:
+    # Serialize a state payload to JSON bytes.
+    # Module ids are int keys, which orjson only accepts with OPT_NON_STR_KEYS.
+    return orjson.dumps(state, option=orjson.OPT_NON_STR_KEYS)
 
-        lat = station.get("lat")
-        lon = station.get("lon")
 
-        items.append(
+def _static_fragment() -> bytes:
+    # Encoded id/name/lat/lon columns, without the surrounding braces.
+    # These rarely change, so they are re-encoded only when static_version moves.
+    global _static_cache
+    if _static_cache is None or _static_cache[0] != static_version:
+        encoded = orjson.dumps(
             {
-                "id": station_id,
-                "name": station.get("name", f"Station {station_id}"),
-                "lat": lat,
-                "lon": lon,
-                "modules": modules,
-                "last_event": station.get("last_event"),
-                "overall_health": 0 if stale else worst,
-                "status": status,
+                "id": stations.ids,
+                "name": stations.names,
+                "lat": stations.lats,
+                "lon": stations.lons,
             }
         )
-    return {"stations": items}
+        _static_cache = (static_version, encoded[1:-1])
+    return _static_cache[1]
 
 
-async def broadcast_state() -> None:
-    # Send the latest world state to all WebSocket clients.
-    # Removes dead connections when sending fails.
-    if not connections:
-        return
-    state = compute_world_state()
-    dead: List[WebSocket] = []
-    for ws in list(connections):
+def _state_columns() -> tuple[List[Any], ...]:
+    # Gather the columns that change between frames, in payload order.
+    return (
+        stations.modules,
+        stations.last_event,
+        stations.status,
+        stations.worst_health,
+    )
+
+
+def _snapshot_columns() -> tuple[List[Any], ...]:
+    # Copy the columns so a worker thread can read them while updates land.
+    # Module entries are replaced (never mutated) on update, so a shallow
+    # copy of each station's module dict is enough.
+    modules, events, statuses, worst = _state_columns()
+    return (
+        [dict(station_modules) for station_modules in modules],
+        list(events),
+        list(statuses),
+        list(worst),
+    )
+
+
+def _dynamic_state(columns: tuple[List[Any], ...]) -> Dict[str, Any]:
+    # Lay the changing fields out as parallel arrays, one per field, so the
+    # encoder walks a few flat lists instead of one dict per station.
+    # Each column is named after the per-station field it holds.
+    modules, events, statuses, worst = columns
+    return {
+        "modules": modules,
+        "last_event": events,
+        "overall_health": [
+            0 if status == STATUS_OFFLINE else health
+            for health, status in zip(worst, statuses)
+        ],
+        "status": [STATUS_NAMES[status] for status in statuses],
+    }
+
+
+def _encode_world_state(static: bytes, columns: tuple[List[Any], ...]) -> bytes:
+    # Splice the cached static fields in front of the freshly encoded rest.
+    return b"{" + static + b"," + _encode(_dynamic_state(columns))[1:]
+
+
+async def encoded_world_state() -> bytes:
+    # Return the encoded world state, re-encoding only after a state change.
+    # Large tables are built off the event loop from a copied snapshot.
+    global _state_cache
+    if _state_cache is not None and _state_cache[0] == world_version:
+        return _state_cache[1]
+    version = world_version
+    static = _static_fragment()
+    if len(stations) > OFFLOAD_THRESHOLD:
+        payload = await asyncio.to_thread(
+            _encode_world_state, static, _snapshot_columns()
+        )
+    else:
+        payload = _encode_world_state(static, _state_columns())
+    if _state_cache is None or _state_cache[0] < version:
+        _state_cache = (version, payload)
+    return payload
+
+
+async def _client_sender(conn: ClientConn) -> None:
+    # Drain one client's queue onto its socket.
+    # A client that errors or stalls past SEND_TIMEOUT gets disconnected.
+    try:
+        while True:
+            payload = await conn.queue.get()
+            await asyncio.wait_for(
+                conn.websocket.send_bytes(payload), timeout=SEND_TIMEOUT
+            )
+    except asyncio.CancelledError:
+        raise
+    except Exception:
         try:
-            await ws.send_text(json.dumps(state))
+            await conn.websocket.close()
         except Exception:
-            dead.append(ws)
-    for ws in dead:
-        try:
-            connections.remove(ws)
-        except ValueError:
             pass
 
 
+def _enqueue(conn: ClientConn, payload: bytes) -> None:
+    # Hand the latest payload to a client, dropping a frame it hasn't sent yet.
+    try:
+        conn.queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        conn.queue.get_nowait()
+        conn.queue.put_nowait(payload)
+
+
+async def broadcast_state() -> None:
+    # Queue the latest world state for all WebSocket clients.
+    # Each client's sender task does the actual write, so a slow client
+    # only falls behind by skipping stale frames.
+    if not connections:
+        return
+    payload = await encoded_world_state()
+    for conn in connections.values():
+        _enqueue(conn, payload)
+
+
+def _schedule_stale_check(station_id: int, last_update_ns: int) -> None:
+    # Record when a station will go stale if it sends nothing further.
+    # An existing entry is earlier than this deadline; when it fires the
+    # loop re-pushes it at the station's real deadline.
+    if station_id in stale_scheduled:
+        return
+    stale_scheduled.add(station_id)
+    deadline_ns = last_update_ns + STALE_TIMEOUT_NS
+    heapq.heappush(stale_heap, (deadline_ns, station_id))
+    if stale_heap[0] == (deadline_ns, station_id):
+        stale_wakeup.set()
+
+
 async def stale_broadcast_loop() -> None:
-    # Periodically recalc statuses, alert, and broadcast.
-    # This handles "offline" transitions even if stations stop updating.
+    # Sleep until the earliest stale deadline, then mark those stations
+    # offline, alert, and broadcast. An entry made early by a newer update
+    # is pushed back at the real deadline when popped.
+    global world_version
     while True:
-        await asyncio.sleep(5)
+        stale_wakeup.clear()
+        if not stale_heap:
+            await stale_wakeup.wait()
+            continue
+        delay = (stale_heap[0][0] - time.time_ns()) / 1_000_000_000
+        if delay > 0:
+            try:
+                await asyncio.wait_for(stale_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
         notify_messages: List[str] = []
         async with state_lock:
-            now = datetime.now(timezone.utc)
-            for station in stations.values():
-                status, worst_name, worst_health, _ = _evaluate_station(station, now)
-                previous_status = station.get("status")
-                station["status"] = status
-                if (
-                    status in ALERT_STATUSES
-                    and status != previous_status
-                    and station.get("last_notified_status") != status
-                ):
-                    station["last_notified_status"] = status
-                    notify_messages.append(
-                        _format_alert_message(station, status, worst_name, worst_health)
-                    )
+            now_ns = time.time_ns()
+            changed = False
+            while stale_heap and stale_heap[0][0] < now_ns:
+                _, station_id = heapq.heappop(stale_heap)
+                row = stations.rows[station_id]
+                deadline_ns = stations.last_update_ns[row] + STALE_TIMEOUT_NS
+                if deadline_ns >= now_ns:
+                    heapq.heappush(stale_heap, (deadline_ns, station_id))
+                    continue
+                stale_scheduled.discard(station_id)
+                if stations.status[row] == STATUS_OFFLINE:
+                    continue
+                changed = True
+                message = _apply_status(row, STATUS_OFFLINE)
+                if message:
+                    notify_messages.append(message)
+            if changed:
+                world_version += 1
         for msg in notify_messages:
-            await _send_telegram_message(msg)
+            _queue_alert(msg)
+        if changed:
+            state_dirty.set()
+
+
+async def broadcaster_loop() -> None:
+    # Single writer for WebSocket pushes.
+    # Changes arriving within the coalesce window go out as one frame.
+    while True:
+        await state_dirty.wait()
+        await asyncio.sleep(BROADCAST_COALESCE_SECONDS)
+        state_dirty.clear()
         await broadcast_state()
 
 
 @app.post("/api/station-update")
-async def station_update(update: StationState) -> Dict[str, Any]:
+async def station_update(request: Request) -> Dict[str, Any]:
     # Receive a station update and update global state.
     # Also emits alerts when status crosses thresholds.
-    notify_message: str | None = None
-    async with state_lock:
-        now = datetime.now(timezone.utc)
-        station = stations.get(update.station_id)
-        if not station:
-            station = cast(
-                StationRecord,
-                {"id": update.station_id, "name": update.name, "modules": {}},
+    # Only trusted stations post here, so the StationState-shaped body is
+    # read straight from orjson instead of being validated by Pydantic.
+    global world_version, static_version
+    try:
+        update = orjson.loads(await request.body())
+        station_id = int(update["station_id"])
+        # Names and events repeat across updates; intern them so the
+        # table holds one copy of each.
+        station_name = sys.intern(update["name"])
+        # Coerce every value here so nothing malformed reaches the table.
+        lat = update.get("lat")
+        lon = update.get("lon")
+        lat = None if lat is None else float(lat)
+        lon = None if lon is None else float(lon)
+        module_updates = [
+            (
+                int(name),
+                int(state.get("health", 100)),
+                bool(state.get("failed", False)),
             )
+            for name, state in update["modules"].items()
+        ]
+        last_event = update.get("last_event")
+        if last_event is not None and not isinstance(last_event, str):
+            raise TypeError("last_event must be a string")
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise HTTPException(status_code=422, detail="Invalid station update")
 
-        station["name"] = update.name
-        station["last_update"] = now
-        if update.lat is not None:
-            station["lat"] = update.lat
-        if update.lon is not None:
-            station["lon"] = update.lon
-
-        modules = station.setdefault("modules", {})
-        for name, module_state in update.modules.items():
-            modules[name] = {
-                "health": module_state.health,
-                "failed": module_state.failed,
-            }
-
-        if update.last_event:
-            station["last_event"] = update.last_event
-
-        status, worst_name, worst_health, _ = _evaluate_station(station, now)
-        prev_status = station.get("status")
-        station["status"] = status
+    async with state_lock:
         if (
-            status in ALERT_STATUSES
-            and status != prev_status
-            and station.get("last_notified_status") != status
+            station_id not in stations.rows
+            or stations.names[stations.rows[station_id]] != station_name
         ):
-            station["last_notified_status"] = status
-            notify_message = _format_alert_message(
-                station, status, worst_name, worst_health
-            )
-
-        stations[update.station_id] = station
+            static_version += 1
+        row = stations.row_for(station_id, station_name)
+        stations.names[row] = station_name
+        now_ns = time.time_ns()
+        stations.last_update_ns[row] = now_ns
+        _schedule_stale_check(station_id, now_ns)
+        if lat is not None and lat != stations.lats[row]:
+            stations.lats[row] = lat
+            static_version += 1
+        if lon is not None and lon != stations.lons[row]:
+            stations.lons[row] = lon
+            static_version += 1
+
+        # Track the worst module incrementally; only rescan all modules
+        # when the previously worst one recovered.
+        modules = stations.modules[row]
+        worst_name = stations.worst_module[row]
+        worst_health = stations.worst_health[row]
+        rescan = False
+        for name, health, failed in module_updates:
+            modules[name] = {"health": health, "failed": failed}
+            if health < worst_health:
+                worst_name, worst_health = name, health
+            elif name == worst_name and health > worst_health:
+                rescan = True
+        if rescan:
+            worst_name, worst_health = _worst_module(modules)
+
+        if last_event:
+            stations.last_event[row] = sys.intern(last_event)
+
+        stations.worst_module[row] = worst_name
+        stations.worst_health[row] = worst_health
+        notify_message = _apply_status(row, _status_code(worst_health, False))
+        world_version += 1
 
     if notify_message:
-        await _send_telegram_message(notify_message)
-    await broadcast_state()
+        _queue_alert(notify_message)
+    state_dirty.set()
     return {"ok": True}
 
 
 @app.get("/api/state")
-async def get_state() -> Dict[str, Any]:
+async def get_state() -> Response:
     # Return current world state snapshot.
     # Used by frontend and by the orchestrator to pick ids.
-    async with state_lock:
-        return compute_world_state()
+    # Lock-free: the columns are read (or copied) before any await.
+    payload = await encoded_world_state()
+    return Response(content=payload, media_type="application/json")
 
 
 @app.websocket("/ws")
@@ -267,10 +543,20 @@ async def websocket_endpoint(websocket: WebSocket):
     # Stream state updates to the frontend in real time.
     # A fresh full-state snapshot is sent on connect.
     await websocket.accept()
-    connections.append(websocket)
+    conn = ClientConn(websocket)
+    # Register before encoding so no broadcast is missed; if one already
+    # queued a frame while we encoded, it is at least as new as ours.
+    connections[id(websocket)] = conn
+    try:
+        payload = await encoded_world_state()
+    except BaseException:
+        connections.pop(id(websocket), None)
+        raise
+    if conn.queue.empty():
+        conn.queue.put_nowait(payload)
+    sender = asyncio.create_task(_client_sender(conn))
+    conn.sender = sender
     try:
-        async with state_lock:
-            await websocket.send_text(json.dumps(compute_world_state()))
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
@@ -278,21 +564,23 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception:
         pass
     finally:
-        try:
-            connections.remove(websocket)
-        except ValueError:
-            pass
+        connections.pop(id(websocket), None)
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
 
 
 def main() -> None:
     # Run the API server.
-    # Starts FastAPI + WebSocket server.
+    # Starts FastAPI + WebSocket server on uvloop with the C HTTP parser.
     port = int(os.environ["BROKER_PORT"])
     uvicorn.run(
         app,
         host="0.0.0.0",
         port=port,
         reload=False,
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
     )
 
 
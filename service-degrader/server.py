@@ -11,27 +11,50 @@ HTTP_CLIENT = HttpClient()
 # In Docker, this will be http://gateway:8000 (see docker-compose.yml)
 GATEWAY_URL = os.environ["GATEWAY_URL"]
 TICK_SECONDS = int(os.environ["TICK_SECONDS"])
+STATIONS_REFRESH_SECONDS = 30
 
+station_ids: list[int] = []
 
-async def choose_station() -> int | None:
+
+async def refresh_stations() -> None:
     """
-    Return a random station id, or None if:
-      - no stations are registered yet, or
-      - the gateway is currently unreachable.
+    Reload the cached list of live station ids from the gateway.
+    On failure the previous list is kept, so ticks carry on with it.
     """
+    global station_ids
     try:
         async with HTTP_CLIENT.session.get(f"{GATEWAY_URL}/api/stations") as resp:
             resp.raise_for_status()
             stations = await resp.json()
+        ids = [station["id"] for station in stations]
     except aiohttp.ClientError as e:
         log.warning(f"Could not reach gateway at {GATEWAY_URL}: {e!r}")
-        return None
+        return
+    except Exception as e:
+        # Timeouts and bad payloads are not ClientErrors; keep the old list.
+        log.warning(f"Station refresh failed, keeping cached list: {e!r}")
+        return
+    station_ids = ids
 
-    if not stations:
-        return None
 
-    station = random.choice(stations)
-    return station["id"]
+async def refresh_stations_loop() -> None:
+    # Keep the station cache fresh in the background.
+    # The station set changes rarely, so ticks don't need to ask every time.
+    while True:
+        await asyncio.sleep(STATIONS_REFRESH_SECONDS)
+        await refresh_stations()
+
+
+def choose_station() -> int | None:
+    """
+    Return a random station id from the cache, or None if:
+      - no stations are registered yet, or
+      - the gateway hasn't been reachable so far.
+    On None the main loop refreshes the cache every tick until it fills.
+    """
+    if not station_ids:
+        return None
+    return random.choice(station_ids)
 
 
 async def main() -> None:
@@ -39,15 +62,20 @@ async def main() -> None:
     # This simulates wear and tear in the system.
     log.info(f"Starting adjust service; tick={TICK_SECONDS}s; gateway={GATEWAY_URL}")
     HTTP_CLIENT.create_session(5)
+    refresh_task: asyncio.Task[None] | None = None
     try:
         # Small initial delay to give gateway time to bind its port (important in Docker)
         await asyncio.sleep(3)
+        await refresh_stations()
+        refresh_task = asyncio.create_task(refresh_stations_loop())
 
         while True:
-            station_id = await choose_station()
+            station_id = choose_station()
             if station_id is None:
                 log.info("No stations available yet or gateway unreachable.")
                 await asyncio.sleep(TICK_SECONDS)
+                # Don't wait for the 30s refresh while there is nothing to do.
+                await refresh_stations()
                 continue
 
             module_id = random.choice(MODULE_IDS)
@@ -67,6 +95,9 @@ async def main() -> None:
 
             await asyncio.sleep(TICK_SECONDS)
     finally:
+        if refresh_task is not None:
+            refresh_task.cancel()
+            await asyncio.gather(refresh_task, return_exceptions=True)
         await HTTP_CLIENT.session.close()
 
 
@@ -1,12 +1,16 @@
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, List
 
 import os
+import time
+import orjson
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
-from vakula_common import AdjustRequest, HttpClient, setup_logger
+from vakula_common import AdjustRequest, HttpClient, post_json, setup_logger
 
 log = setup_logger("GATEWAY")
 HTTP_CLIENT = HttpClient()
@@ -23,7 +27,11 @@ async def lifespan(app: FastAPI):
         await HTTP_CLIENT.session.close()
 
 
-app = FastAPI(title="Vakula Gateway / Registrar", lifespan=lifespan)
+app = FastAPI(
+    title="Vakula Gateway / Registrar",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 
 class RegistrationRequest(BaseModel):
@@ -39,6 +47,43 @@ class StationInfo(BaseModel):
     last_heartbeat: datetime
 
 
+class StationEntry(BaseModel):
+    # Registry record. Liveness uses the monotonic clock so wall-clock jumps
+    # can't revive or expire stations; the wall time is kept only for
+    # display. StationInfo is built on demand.
+    id: int
+    name: str
+    base_url: str
+    last_heartbeat_ns: int = 0
+    last_seen_monotonic_ns: int = 0
+
+    def touch(self) -> None:
+        self.last_heartbeat_ns = time.time_ns()
+        self.last_seen_monotonic_ns = time.monotonic_ns()
+
+    def last_heartbeat(self) -> datetime:
+        return datetime.fromtimestamp(
+            self.last_heartbeat_ns / 1_000_000_000, timezone.utc
+        )
+
+    def to_info(self) -> StationInfo:
+        return StationInfo(
+            id=self.id,
+            name=self.name,
+            base_url=self.base_url,
+            last_heartbeat=self.last_heartbeat(),
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        # StationInfo-shaped plain dict, for encoding without a model.
+        return {
+            "id": self.id,
+            "name": self.name,
+            "base_url": self.base_url,
+            "last_heartbeat": self.last_heartbeat(),
+        }
+
+
 class Heartbeat(BaseModel):
     pass
 
@@ -47,13 +92,16 @@ class AdjustCommand(AdjustRequest):
     pass
 
 
-STATIONS: Dict[int, StationInfo] = {}
+# Kept in heartbeat order (oldest first): every register/heartbeat moves the
+# station to the end, so the live stations are always a suffix.
+STATIONS: OrderedDict[int, StationEntry] = OrderedDict()
 NEXT_ID: int = 0
 
 HEARTBEAT_TIMEOUT = int(os.environ["HEARTBEAT_TIMEOUT_SECONDS"])
+HEARTBEAT_TIMEOUT_NS = HEARTBEAT_TIMEOUT * 1_000_000_000
 
 
-def _get_station_or_404(station_id: int) -> StationInfo:
+def _get_station_or_404(station_id: int) -> StationEntry:
     # Helper: return station or fail fast if it doesn't exist.
     # Keeps the endpoints small and consistent.
     station = STATIONS.get(station_id)
@@ -63,70 +111,95 @@ def _get_station_or_404(station_id: int) -> StationInfo:
 
 
 @app.post("/api/register", response_model=StationInfo)
-def register_station(request: RegistrationRequest) -> StationInfo:
+async def register_station(request: RegistrationRequest) -> StationInfo:
     # Register a station or update it if the same id already exists.
     # Station IDs are assigned by the gateway unless the station asks for one.
+    # Runs on the event loop (not the threadpool) so id allocation is atomic.
     global NEXT_ID
-    station_id = request.station_id if request.station_id is not None else NEXT_ID
-    if request.station_id is None:
-        NEXT_ID += 1
+    station_id = request.station_id
+    existing = None
+    if station_id is None:
+        station_id = NEXT_ID
     else:
         existing = STATIONS.get(station_id)
-        if existing:
-            existing.name = request.name
-            existing.base_url = request.base_url
-            existing.last_heartbeat = datetime.now(timezone.utc)
-            log.info(f"Updated station {station_id}: {existing.name} @ {existing.base_url}")
-            return existing
-        if station_id >= NEXT_ID:
-            NEXT_ID = station_id + 1
-
-    info = StationInfo(
+    if existing is not None:
+        existing.name = request.name
+        existing.base_url = request.base_url
+        existing.touch()
+        STATIONS.move_to_end(station_id)
+        log.info(
+            "Updated station %d: %s @ %s",
+            station_id,
+            existing.name,
+            existing.base_url,
+        )
+        return existing.to_info()
+    NEXT_ID = max(NEXT_ID, station_id + 1)
+
+    entry = StationEntry(
         id=station_id,
         name=request.name,
         base_url=request.base_url,
-        last_heartbeat=datetime.now(timezone.utc),
     )
-    STATIONS[station_id] = info
-    log.info(f"Registered station {station_id}: {info.name} @ {info.base_url}")
-    return info
+    entry.touch()
+    STATIONS[station_id] = entry
+    log.info(
+        "Registered station %d: %s @ %s", station_id, entry.name, entry.base_url
+    )
+    return entry.to_info()
 
 
 @app.post("/api/stations/{station_id}/heartbeat")
-def heartbeat(station_id: int, hb: Heartbeat) -> dict[str, bool]:
+async def heartbeat(station_id: int, hb: Heartbeat) -> dict[str, bool]:
     # Mark station as alive by updating its last heartbeat time.
     # Broker uses this to filter out offline stations.
+    # Async so move_to_end never races a list_stations walk in the threadpool.
     station = _get_station_or_404(station_id)
-    station.last_heartbeat = datetime.now(timezone.utc)
+    station.touch()
+    STATIONS.move_to_end(station_id)
     return {"ok": True}
 
 
 @app.get("/api/stations", response_model=List[StationInfo])
-def list_stations() -> List[StationInfo]:
+async def list_stations() -> Response:
     # Return only stations with recent heartbeats.
     # This list is used by the degrader and orchestrator.
-    now = datetime.now(timezone.utc)
-    alive: List[StationInfo] = []
-    for station in STATIONS.values():
-        if now - station.last_heartbeat <= timedelta(seconds=HEARTBEAT_TIMEOUT):
-            alive.append(station)
-    return alive
+    # Walks back from the newest heartbeat and stops at the first dead one.
+    # Encoded straight from plain dicts; response_model is kept for the docs.
+    cutoff_ns = time.monotonic_ns() - HEARTBEAT_TIMEOUT_NS
+    alive: List[dict[str, Any]] = []
+    for station in reversed(STATIONS.values()):
+        if station.last_seen_monotonic_ns < cutoff_ns:
+            break
+        alive.append(station.to_dict())
+    alive.reverse()
+    return Response(
+        content=orjson.dumps(alive, option=orjson.OPT_UTC_Z),
+        media_type="application/json",
+    )
+
+
+@app.get("/api/next_id")
+async def next_station_id() -> dict[str, int]:
+    # Return the id the gateway would assign to the next new station.
+    # Lets the orchestrator pick ids without downloading the station list.
+    return {"next_id": NEXT_ID}
 
 
 @app.get("/api/stations/{station_id}", response_model=StationInfo)
-def get_station(station_id: int) -> StationInfo:
+async def get_station(station_id: int) -> StationInfo:
     # Fetch a single station's info.
     # Used for debugging and possible admin tooling.
-    return _get_station_or_404(station_id)
+    return _get_station_or_404(station_id).to_info()
 
 
 async def _forward_to_station(
-    station: StationInfo, path: str, payload: dict[str, Any]
+    station: StationEntry, path: str, payload: dict[str, Any]
 ) -> dict[str, Any]:
     # Send a command to the station's own API.
     # This keeps clients from needing the station URL directly.
     url = f"{station.base_url}{path}"
-    async with HTTP_CLIENT.session.post(url, json=payload) as resp:
+    async with post_json(HTTP_CLIENT.session, url, payload) as resp:
         resp.raise_for_status()
         return await resp.json()
 
@@ -138,14 +211,20 @@ async def gateway_adjust(station_id: int, cmd: AdjustCommand) -> dict[str, Any]:
     station = _get_station_or_404(station_id)
     direction = "repair" if cmd.amount >= 0 else "degrade"
     log.info(
-        f"Forwarding {direction} to station {station_id} ({station.name}): "
-        f"{cmd.module} {cmd.amount:+d}%"
+        "Forwarding %s to station %d (%s): %d %+d%%",
+        direction,
+        station_id,
+        station.name,
+        cmd.module,
+        cmd.amount,
     )
     try:
-        result = await _forward_to_station(station, "/adjust", cmd.model_dump())
+        # Plain dict literal: cheaper than a reflective model_dump() per forward.
+        payload = {"module": cmd.module, "amount": cmd.amount, "reason": cmd.reason}
+        result = await _forward_to_station(station, "/adjust", payload)
         return {"ok": True, "station_id": station_id, "station_response": result}
     except Exception as e:
-        log.warning(f"Failed to forward adjust to station {station_id}: {e!r}")
+        log.warning("Failed to forward adjust to station %d: %r", station_id, e)
         raise HTTPException(status_code=502, detail="Station unreachable")
 
 
@@ -158,6 +237,8 @@ def main() -> None:
         host="0.0.0.0",
         port=port,
         reload=False,
+        loop="uvloop",
+        http="httptools",
     )
 
 
@@ -1,15 +1,18 @@
-import json
+import asyncio
+import functools
 import os
 import re
 import unicodedata
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List
 
 import aiohttp
+import orjson
 import uvicorn
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, field_validator
-from vakula_common import HttpClient, setup_logger
+from vakula_common import JSON_HEADERS, HttpClient, setup_logger
 
 log = setup_logger("ORCH")
 HTTP_CLIENT = HttpClient()
@@ -20,12 +23,15 @@ DOCKER_CLIENT = HttpClient()
 async def lifespan(app: FastAPI):
     # Create shared sessions for HTTP and Docker socket calls.
     # This avoids reconnect overhead for every request and keeps it centralized.
-    HTTP_CLIENT.create_session(5)
+    # Broker/gateway are hit repeatedly: cache their DNS.
+    HTTP_CLIENT.create_session(5, ttl_dns_cache=300)
     connector = aiohttp.UnixConnector(path=DOCKER_SOCKET)
     DOCKER_CLIENT.session = aiohttp.ClientSession(
         connector=connector,
         base_url="http://docker",
+        timeout=DOCKER_TIMEOUT,
     )
+    await _negotiate_docker_version()
     try:
         yield
     finally:
@@ -33,14 +39,36 @@ async def lifespan(app: FastAPI):
         await DOCKER_CLIENT.session.close()
 
 
-app = FastAPI(title="Vakula Station Orchestrator", lifespan=lifespan)
+app = FastAPI(
+    title="Vakula Station Orchestrator",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 DOCKER_SOCKET = os.environ["DOCKER_SOCKET"]
 DOCKER_API_VERSION = os.environ["DOCKER_API_VERSION"]
+# Fallback version prefixes tried when dockerd rejects the current one as too old.
+DOCKER_PREFIX_LADDER = ["/v1.44", "/v1.45", "/v1.46"]
+# Versioned path prefix used for Docker calls, negotiated once at startup.
+_docker_prefix = (
+    f"/{DOCKER_API_VERSION}" if DOCKER_API_VERSION else DOCKER_PREFIX_LADDER[0]
+)
+# (image, network) for station containers, resolved from the gateway once.
+_station_target_cache: tuple[str, str] | None = None
+_station_target_lock = asyncio.Lock()
+# Cleared once dockerd rejects /containers/json filters.
+_docker_filters_supported = True
 GATEWAY_URL = os.environ["GATEWAY_URL"]
 BROKER_URL = os.environ["BROKER_URL"]
 STATION_IMAGE = os.environ.get("STATION_IMAGE", "")
 ORCHESTRATOR_NETWORK = os.environ["ORCHESTRATOR_NETWORK"]
+# Docker API deadlines so a hung daemon can't stall station creation forever.
+DOCKER_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=2)
+DOCKER_START_TIMEOUT = aiohttp.ClientTimeout(total=60, connect=2)
+# Max station creations talking to dockerd at once.
+CREATE_CONCURRENCY = 8
+# Runs of characters that are not valid in a container name slug.
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
 
 
 class CreateStationRequest(BaseModel):
@@ -84,63 +112,74 @@ class SimpleResponse:
             raise RuntimeError(f"Docker API error {self.status_code}: {self.text}")
 
 
+@functools.lru_cache(maxsize=1024)
 def _slugify(value: str) -> str:
     # Turn a station name into a Docker-friendly container name.
     # We normalize accents and replace non-alphanumerics with dashes.
-    normalized = unicodedata.normalize("NFKD", value)
-    ascii_value = normalized.encode("ascii", "ignore").decode("ascii")
-    ascii_value = ascii_value.lower()
-    ascii_value = re.sub(r"[^a-z0-9]+", "-", ascii_value).strip("-")
-    return ascii_value
+    if not value.isascii():
+        normalized = unicodedata.normalize("NFKD", value)
+        value = normalized.encode("ascii", "ignore").decode("ascii")
+    return _SLUG_RE.sub("-", value.lower()).strip("-")
 
 
 async def _next_station_id() -> int:
-    # Pick the next free station id based on broker/gateway state.
-    # Broker is preferred (has full state), gateway is fallback.
+    # Pick the next free station id based on gateway/broker state.
+    # The gateway's own allocator is asked first (O(1), no station list);
+    # scanning broker state, then the gateway list, is the fallback.
     try:
-        async with HTTP_CLIENT.session.get(f"{BROKER_URL}/api/state") as resp:
+        async with HTTP_CLIENT.session.get(f"{GATEWAY_URL}/api/next_id") as resp:
             resp.raise_for_status()
             data = await resp.json()
-            stations = data.get("stations", [])
-        if stations:
-            ids = [int(station["id"]) for station in stations if "id" in station]
-            if ids:
-                return max(ids) + 1
+        next_id = int(data["next_id"])
+        if next_id > 0:
+            return next_id
     except Exception as e:
-        log.warning(f"Failed to fetch stations from broker: {e!r}")
+        log.warning("Failed to fetch next id from gateway: %r", e)
+
+    try:
+        _, max_id = await _fetch_broker_snapshot()
+        if max_id is not None:
+            return max_id + 1
+    except Exception as e:
+        log.warning("Failed to fetch stations from broker: %r", e)
 
     try:
         async with HTTP_CLIENT.session.get(f"{GATEWAY_URL}/api/stations") as resp:
             resp.raise_for_status()
             stations = await resp.json()
-        if stations:
-            ids = [int(station["id"]) for station in stations if "id" in station]
-            if ids:
-                return max(ids) + 1
+        best = max(
+            (int(station["id"]) for station in stations if "id" in station),
+            default=None,
+        )
+        if best is not None:
+            return best + 1
     except Exception as e:
-        log.warning(f"Failed to fetch stations from gateway: {e!r}")
+        log.warning("Failed to fetch stations from gateway: %r", e)
 
     return 1000
 
 
-async def _station_exists(name: str, lat: float, lon: float) -> bool:
-    # Check if a station with same name/coords already exists.
-    # This prevents duplicates stacking on the same map location.
+async def _fetch_broker_snapshot() -> tuple[set[tuple[str, float, float]], int | None]:
+    # Read broker state once: existing (name, lat, lon) keys and the max id.
+    # Lets a whole creation batch share a single /api/state call.
+    async with HTTP_CLIENT.session.get(f"{BROKER_URL}/api/state") as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+    # Broker state is columnar: parallel id/name/lat/lon arrays.
+    keys = set(zip(data.get("name", []), data.get("lat", []), data.get("lon", [])))
+    max_id = max((int(station_id) for station_id in data.get("id", [])), default=None)
+    return keys, max_id
+
+
+async def _existing_station_keys() -> set[tuple[str, float, float]]:
+    # Existing (name, lat, lon) keys, used to reject duplicate stations.
+    # Empty if the broker is unreachable, so creation is not blocked.
     try:
-        async with HTTP_CLIENT.session.get(f"{BROKER_URL}/api/state") as resp:
-            resp.raise_for_status()
-            data = await resp.json()
-            stations = data.get("stations", [])
-        for station in stations:
-            if (
-                station.get("name") == name
-                and station.get("lat") == lat
-                and station.get("lon") == lon
-            ):
-                return True
+        keys, _ = await _fetch_broker_snapshot()
+        return keys
     except Exception as e:
-        log.warning(f"Failed to check existing stations: {e!r}")
-    return False
+        log.warning("Failed to check existing stations: %r", e)
+        return set()
 
 
 async def _docker_request(
@@ -149,68 +188,104 @@ async def _docker_request(
     *,
     params: dict[str, str] | None = None,
     json_body: dict[str, Any] | None = None,
+    timeout: aiohttp.ClientTimeout = DOCKER_TIMEOUT,
 ) -> SimpleResponse:
     # Low-level helper for Docker HTTP API calls.
-    # It tries multiple API versions for compatibility.
-    versions = [DOCKER_API_VERSION, "v1.44", "v1.45", "v1.46"]
-    seen: set[str] = set()
-    last_response: SimpleResponse | None = None
-    for version in versions:
-        if not version or version in seen:
+    # Uses the negotiated API version; walks the ladder only if it is rejected.
+    global _docker_prefix
+    r = await _docker_call(_docker_prefix, method, path, params, json_body, timeout)
+    if r.status_code != 400 or "too old" not in r.text:
+        return r
+    for prefix in DOCKER_PREFIX_LADDER:
+        if prefix == _docker_prefix:
             continue
-        seen.add(version)
-        url = f"/{version}{path}"
-        async with DOCKER_CLIENT.session.request(
-            method,
-            url,
-            params=params,
-            json=json_body,
-        ) as resp:
-            text = await resp.text()
-            try:
-                data = json.loads(text) if text else None
-            except json.JSONDecodeError:
-                data = None
-            r = SimpleResponse(resp.status, text, data)
-        last_response = r
-        if r.status_code != 400:
-            return r
-        if "too old" not in r.text:
+        r = await _docker_call(prefix, method, path, params, json_body, timeout)
+        if r.status_code != 400 or "too old" not in r.text:
+            _docker_prefix = prefix
             return r
-    assert last_response is not None
-    return last_response
+    return r
+
+
+async def _docker_call(
+    prefix: str,
+    method: str,
+    path: str,
+    params: dict[str, str] | None,
+    json_body: dict[str, Any] | None,
+    timeout: aiohttp.ClientTimeout,
+) -> SimpleResponse:
+    # Issue a single Docker API call against one versioned prefix.
+    # Bodies are encoded and decoded with orjson; text is kept only for errors.
+    async with DOCKER_CLIENT.session.request(
+        method,
+        prefix + path,
+        params=params,
+        data=orjson.dumps(json_body) if json_body is not None else None,
+        headers=JSON_HEADERS if json_body is not None else None,
+        timeout=timeout,
+    ) as resp:
+        body = await resp.read()
+    try:
+        data = orjson.loads(body) if body else None
+    except orjson.JSONDecodeError:
+        data = None
+    text = body.decode("utf-8", "replace") if resp.status >= 400 else ""
+    return SimpleResponse(resp.status, text, data)
+
+
+async def _negotiate_docker_version() -> None:
+    # Ask dockerd once for its API version so calls skip the version ladder.
+    # On failure we keep the configured DOCKER_API_VERSION.
+    global _docker_prefix
+    try:
+        async with DOCKER_CLIENT.session.get("/version") as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+        _docker_prefix = f"/v{data['ApiVersion']}"
+        log.info("Negotiated Docker API prefix %s", _docker_prefix)
+    except Exception as e:
+        log.warning(
+            "Docker version negotiation failed, using %s: %r", _docker_prefix, e
+        )
+
+
+@functools.lru_cache(maxsize=16)
+def _service_filter(service_name: str) -> str:
+    # Encoded Docker filter for a running compose service, built once per name.
+    filters = {
+        "label": [f"com.docker.compose.service={service_name}"],
+        "status": ["running"],
+    }
+    return orjson.dumps(filters).decode()
 
 
 async def _find_compose_container(service_name: str) -> Dict[str, Any]:
-    # Find a running compose container by service name.
-    # We search by Docker labels first, then fall back to name scanning.
-    filters = {"label": [f"com.docker.compose.service={service_name}"]}
-    r = await _docker_request(
-        "GET",
-        "/containers/json",
-        params={"filters": json.dumps(filters)},
-    )
-    if r.status_code == 400:
-        log.warning(f"Docker filters rejected; falling back to name scan: {r.text}")
-        r = await _docker_request("GET", "/containers/json")
+    # Find a running compose container by its compose service label.
+    # Docker filters server-side; daemons that reject filters are remembered
+    # and get a plain listing that is label-matched here instead.
+    global _docker_filters_supported
+    params = {"all": "false", "size": "false"}
+    r: SimpleResponse | None = None
+    if _docker_filters_supported:
+        r = await _docker_request(
+            "GET",
+            "/containers/json",
+            params={**params, "filters": _service_filter(service_name)},
+        )
+        if r.status_code == 400:
+            log.warning("Docker filters rejected; matching labels locally: %s", r.text)
+            _docker_filters_supported = False
+            r = None
+    if r is None:
+        r = await _docker_request("GET", "/containers/json", params=params)
     r.raise_for_status()
     containers = r.json()
 
-    if not containers:
-        raise HTTPException(
-            status_code=502, detail=f"No container found for {service_name}"
-        )
-
-    for container in containers:
-        labels = container.get("Labels", {})
+    for container in containers or []:
+        labels = container.get("Labels") or {}
         if labels.get("com.docker.compose.service") == service_name:
             return container
 
-    for container in containers:
-        for name in container.get("Names", []):
-            if service_name in name:
-                return container
-
     raise HTTPException(
         status_code=502, detail=f"No container found for {service_name}"
     )
@@ -235,6 +310,35 @@ def _pick_network(inspect: Dict[str, Any]) -> str:
     return "bridge"
 
 
+async def _station_target() -> tuple[str, str]:
+    # Resolve (image, network) for new stations from the gateway container.
+    # Cached after the first lookup; _raise_for_target drops it on Docker errors.
+    global _station_target_cache
+    async with _station_target_lock:
+        if _station_target_cache is not None:
+            return _station_target_cache
+        gateway_container = await _find_compose_container("gateway")
+        gateway_inspect = await _inspect_container(gateway_container["Id"])
+        network_name = _pick_network(gateway_inspect)
+        config = gateway_inspect.get("Config", {})
+        image_name = STATION_IMAGE or config.get("Image", "")
+        if not image_name:
+            raise HTTPException(
+                status_code=500, detail="Could not resolve station image"
+            )
+        _station_target_cache = (image_name, network_name)
+        return _station_target_cache
+
+
+def _raise_for_target(r: SimpleResponse) -> None:
+    # Raise on a failed container create, forgetting the cached image and
+    # network so a recreated gateway is rediscovered on the next call.
+    global _station_target_cache
+    if r.status_code >= 400:
+        _station_target_cache = None
+    r.raise_for_status()
+
+
 async def _docker_create_container(
     payload: Dict[str, Any], name: str
 ) -> SimpleResponse:
@@ -251,7 +355,12 @@ async def _docker_create_container(
 async def _docker_start_container(container_id: str) -> None:
     # Start a container by id.
     # Equivalent to "docker start".
-    r = await _docker_request("POST", f"/containers/{container_id}/start")
+    # Starts can legitimately take longer, so they get their own deadline.
+    r = await _docker_request(
+        "POST",
+        f"/containers/{container_id}/start",
+        timeout=DOCKER_START_TIMEOUT,
+    )
     r.raise_for_status()
 
 
@@ -267,81 +376,74 @@ async def _docker_remove_container(container_name: str) -> None:
         r.raise_for_status()
 
 
+@contextmanager
+def _docker_errors(step: str) -> Iterator[None]:
+    # Turn Docker transport failures into 504/502s that name the failed step,
+    # instead of a bare 500 when a call hits DOCKER_TIMEOUT.
+    try:
+        yield
+    except asyncio.TimeoutError:
+        log.warning("Docker timed out during %s", step)
+        raise HTTPException(status_code=504, detail=f"Docker timed out during {step}")
+    except aiohttp.ClientError as e:
+        log.warning("Docker %s failed: %r", step, e)
+        raise HTTPException(status_code=502, detail=f"Docker {step} failed: {e!r}")
+
+
 async def _create_station(request: CreateStationRequest) -> CreateStationResponse:
     # Create and start a new station container.
     # Steps: find gateway container -> pick network -> create station container.
-    if await _station_exists(request.name, request.lat, request.lon):
-        raise HTTPException(
-            status_code=409,
-            detail="Station with same name and coordinates already exists",
-        )
-    gateway_container = await _find_compose_container("gateway")
-    gateway_inspect = await _inspect_container(gateway_container["Id"])
-    network_name = _pick_network(gateway_inspect)
-    image_name = STATION_IMAGE or gateway_inspect.get("Config", {}).get("Image", "")
-    if not image_name:
-        raise HTTPException(status_code=500, detail="Could not resolve station image")
-
     station_id = request.station_id
-    if station_id is None:
-        station_id = await _next_station_id()
-
+    with _docker_errors("station target lookup"):
+        if station_id is None:
+            # Independent lookups; run them side by side.
+            (image_name, network_name), station_id = await asyncio.gather(
+                _station_target(), _next_station_id()
+            )
+        else:
+            image_name, network_name = await _station_target()
+
+    # The station id suffix makes the name unique, so no name-probing loop.
     slug = _slugify(request.name)
-    if not slug:
-        slug = f"station-{station_id}"
-    base_name = f"station-{slug}"
-    base_env = [
-        f"GATEWAY_URL={GATEWAY_URL}",
-        f"BROKER_URL={BROKER_URL}",
-        f"STATION_NAME={request.name}",
-        f"STATION_ID={station_id}",
-        f"STATION_LAT={request.lat}",
-        f"STATION_LON={request.lon}",
-        "PORT=9000",
-    ]
-    container_id: str | None = None
-    container_name: str | None = None
-    base_url: str | None = None
-    last_conflict: SimpleResponse | None = None
-    for attempt in range(10):
-        container_name = base_name if attempt == 0 else f"{base_name}-{attempt}"
-        base_url = f"http://{container_name}:9000"
-        env = [
-            *base_env,
+    container_name = (
+        f"station-{slug}-{station_id}" if slug else f"station-{station_id}"
+    )
+    base_url = f"http://{container_name}:9000"
+    payload: Dict[str, Any] = {
+        "Image": image_name,
+        "Cmd": ["python", "/app/service-station/server.py"],
+        "Env": [
+            f"GATEWAY_URL={GATEWAY_URL}",
+            f"BROKER_URL={BROKER_URL}",
+            f"STATION_NAME={request.name}",
+            f"STATION_ID={station_id}",
+            f"STATION_LAT={request.lat}",
+            f"STATION_LON={request.lon}",
+            "PORT=9000",
             f"PUBLIC_BASE_URL={base_url}",
-        ]
-        payload: Dict[str, Any] = {
-            "Image": image_name,
-            "Cmd": ["python", "/app/service-station/server.py"],
-            "Env": env,
-            "ExposedPorts": {"9000/tcp": {}},
-            "HostConfig": {
-                "NetworkMode": network_name,
-                "RestartPolicy": {"Name": "unless-stopped"},
-            },
-        }
-
+        ],
+        "ExposedPorts": {"9000/tcp": {}},
+        "HostConfig": {
+            "NetworkMode": network_name,
+            "RestartPolicy": {"Name": "unless-stopped"},
+        },
+    }
+
+    with _docker_errors("container create"):
         r = await _docker_create_container(payload, container_name)
         if r.status_code == 409:
+            # A leftover container for this station id; replace it once.
             await _docker_remove_container(container_name)
             r = await _docker_create_container(payload, container_name)
             if r.status_code == 409:
-                last_conflict = r
-                continue
-            r.raise_for_status()
-            container_id = r.json()["Id"]
-            break
-        r.raise_for_status()
-        container_id = r.json()["Id"]
-        break
+                raise HTTPException(
+                    status_code=409, detail=f"Container name conflict: {r.text}"
+                )
+    _raise_for_target(r)
+    container_id = r.json()["Id"]
 
-    if container_id is None or container_name is None or base_url is None:
-        detail = "Container name already exists."
-        if last_conflict is not None:
-            detail = f"Container name conflict: {last_conflict.text}"
-        raise HTTPException(status_code=409, detail=detail)
-
-    await _docker_start_container(container_id)
+    with _docker_errors("container start"):
+        await _docker_start_container(container_id)
 
     return CreateStationResponse(
         ok=True, container_id=container_id, container_name=container_name
@@ -353,8 +455,18 @@ async def create_station(
     requests: List[CreateStationRequest],
 ) -> List[CreateStationResponse]:
     # Create one or more stations in a single request.
-    # If station_id is missing, we auto-assign sequential ids.
-    results: List[CreateStationResponse] = []
+    # Missing station ids are assigned sequentially up front, then the
+    # containers are created concurrently (bounded by CREATE_CONCURRENCY).
+    # Broker state is read once, and the whole batch is checked for
+    # duplicates before any container is touched.
+    existing_keys = await _existing_station_keys()
+    for request in requests:
+        if (request.name, request.lat, request.lon) in existing_keys:
+            raise HTTPException(
+                status_code=409,
+                detail="Station with same name and coordinates already exists",
+            )
+    assigned: List[CreateStationRequest] = []
     next_id: int | None = None
     for request in requests:
         if request.station_id is None:
@@ -362,8 +474,23 @@ async def create_station(
                 next_id = await _next_station_id()
             request = request.model_copy(update={"station_id": next_id})
             next_id += 1
-        results.append(await _create_station(request))
-    return results
+        assigned.append(request)
+
+    semaphore = asyncio.Semaphore(CREATE_CONCURRENCY)
+
+    async def create_bounded(request: CreateStationRequest) -> CreateStationResponse:
+        async with semaphore:
+            return await _create_station(request)
+
+    # The first failure cancels the rest of the batch, like the old
+    # one-at-a-time loop, and is what the client sees.
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(create_bounded(r)) for r in assigned]
+    except BaseExceptionGroup as eg:
+        http_errors = [e for e in eg.exceptions if isinstance(e, HTTPException)]
+        raise (http_errors or eg.exceptions)[0]
+    return [task.result() for task in tasks]
 
 
 def main() -> None:
@@ -375,6 +502,8 @@ def main() -> None:
         host="0.0.0.0",
         port=port,
         reload=False,
+        loop="uvloop",
+        http="httptools",
     )
 
 
@@ -4,8 +4,11 @@ import os
 from contextlib import asynccontextmanager
 from typing import Any, Dict
 
+import aiohttp
+import orjson
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from vakula_common import (
     AdjustRequest,
     HttpClient,
@@ -14,6 +17,7 @@ from vakula_common import (
     StationState,
     make_logger,
     module_name,
+    post_json,
     setup_logger,
 )
 
@@ -30,6 +34,24 @@ _lat = os.environ.get("STATION_LAT")
 _lon = os.environ.get("STATION_LON")
 STATION_LAT = float(_lat) if _lat else None
 STATION_LON = float(_lon) if _lon else None
+# Immutable part of every broker update.
+STATION_BASE: dict[str, Any] = {
+    "station_id": STATION_ID,
+    "name": STATION_NAME,
+    "lat": STATION_LAT,
+    "lon": STATION_LON,
+}
+# Deterministic 1-15s heartbeat stagger from a Knuth multiplicative hash of
+# the station id: spread like random jitter, but reproducible per station.
+HEARTBEAT_STAGGER_SECONDS = (
+    1.0 + (((STATION_ID * 2654435761) & 0xFFFFFFFF) >> 16) / 0xFFFF * 14.0
+)
+# Minimum spacing between change-driven broker updates.
+BROKER_FLUSH_SECONDS = 0.1
+# Gateway registration retry backoff bounds; the cap stays above the old 3s
+# fixed retry so a down gateway sees less load, not more.
+REGISTER_BACKOFF_INITIAL_SECONDS = 0.1
+REGISTER_BACKOFF_MAX_SECONDS = 30.0
 
 
 @asynccontextmanager
@@ -41,18 +63,28 @@ async def lifespan(app: FastAPI):
     logger.info(f"Station startup id={STATION_ID}")
     HTTP_CLIENT.create_session(5)
     await notify_broker()
-    register_task = asyncio.create_task(register_with_gateway_loop())
-    heartbeat_task = asyncio.create_task(heartbeat_loop())
+    tasks = [
+        asyncio.create_task(register_with_gateway_loop()),
+        asyncio.create_task(heartbeat_loop()),
+        asyncio.create_task(broker_flush_loop()),
+    ]
     try:
         yield
     finally:
-        for task in (register_task, heartbeat_task):
+        for task in tasks:
             task.cancel()
-        await asyncio.gather(register_task, heartbeat_task, return_exceptions=True)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Push any change the flusher hadn't sent yet before closing.
+        if broker_dirty.is_set():
+            await notify_broker()
         await HTTP_CLIENT.session.close()
 
 
-app = FastAPI(title=f"Station {STATION_NAME}", lifespan=lifespan)
+app = FastAPI(
+    title=f"Station {STATION_NAME}",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 gateway_registered: bool = False
 logger = make_logger(log, STATION_NAME)
@@ -61,6 +93,8 @@ HTTP_CLIENT = HttpClient()
 
 modules: Dict[int, ModuleState] = {module_id: ModuleState() for module_id in MODULE_IDS}
 last_event: str | None = None
+# Set when module state changed and the broker hasn't been told yet.
+broker_dirty = asyncio.Event()
 
 
 async def notify_broker() -> None:
@@ -68,18 +102,45 @@ async def notify_broker() -> None:
     # The broker then broadcasts this to the frontend.
     global last_event
 
-    payload = _build_station_state().model_dump()
+    payload = _station_payload()
 
     try:
-        async with HTTP_CLIENT.session.post(
-            f"{BROKER_URL}/api/station-update",
-            json=payload,
-        ) as resp:
-            resp.raise_for_status()
+        resp = await _post_retry(f"{BROKER_URL}/api/station-update", payload)
+        resp.raise_for_status()
     except Exception as e:
         logger.warning(f"Failed to notify broker: {e!r}")
 
 
+async def broker_flush_loop() -> None:
+    # Send the latest state after changes, at most once per flush interval.
+    # Bursts of /adjust calls collapse into a single broker update.
+    while True:
+        await broker_dirty.wait()
+        broker_dirty.clear()
+        await notify_broker()
+        await asyncio.sleep(BROKER_FLUSH_SECONDS)
+
+
+async def _post_once(url: str, payload: dict[Any, Any]) -> aiohttp.ClientResponse:
+    # POST and read the body so the response is usable after release.
+    # Module ids are int keys, which orjson only accepts with OPT_NON_STR_KEYS.
+    async with post_json(
+        HTTP_CLIENT.session, url, payload, option=orjson.OPT_NON_STR_KEYS
+    ) as resp:
+        await resp.read()
+    return resp
+
+
+async def _post_retry(url: str, payload: dict[Any, Any]) -> aiohttp.ClientResponse:
+    # POST on the shared session, retrying once on a dropped connection.
+    # A restarted broker/gateway leaves stale keep-alive sockets in the pool.
+    try:
+        return await _post_once(url, payload)
+    except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError) as e:
+        logger.info(f"Retrying POST {url} after stale connection: {e!r}")
+        return await _post_once(url, payload)
+
+
 def _get_module_or_404(module_id: int) -> ModuleState:
     # Validate module id and return its state.
     # Prevents accidental updates to unknown modules.
@@ -88,17 +149,17 @@ def _get_module_or_404(module_id: int) -> ModuleState:
     return modules[module_id]
 
 
-def _build_station_state() -> StationState:
-    # Build the current station snapshot.
-    # Used for both broker updates and the /state endpoint.
-    return StationState(
-        station_id=STATION_ID,
-        name=STATION_NAME,
-        lat=STATION_LAT,
-        lon=STATION_LON,
-        modules=modules,
-        last_event=last_event,
-    )
+def _station_payload() -> dict[str, Any]:
+    # StationState-shaped dict for the broker and /state, no model pass.
+    # Only modules and last_event change; the identity fields are prebuilt.
+    return {
+        **STATION_BASE,
+        "modules": {
+            module_id: {"health": state.health, "failed": state.failed}
+            for module_id, state in modules.items()
+        },
+        "last_event": last_event,
+    }
 
 
 async def register_with_gateway() -> bool:
@@ -109,12 +170,9 @@ async def register_with_gateway() -> bool:
         "name": STATION_NAME,
         "base_url": PUBLIC_BASE_URL,
     }
-    async with HTTP_CLIENT.session.post(
-        f"{GATEWAY_URL}/api/register",
-        json=payload,
-    ) as resp:
-        resp.raise_for_status()
-        data = await resp.json()
+    resp = await _post_retry(f"{GATEWAY_URL}/api/register", payload)
+    resp.raise_for_status()
+    data = await resp.json()
     gateway_id = int(data["id"])
     if gateway_id != STATION_ID:
         logger.warning(
@@ -126,7 +184,9 @@ async def register_with_gateway() -> bool:
 async def register_with_gateway_loop() -> None:
     # Keep retrying registration until it succeeds.
     # Useful during startup when other services may not be ready yet.
+    # Back off exponentially (with jitter) so a fast gateway is picked up quickly.
     global gateway_registered
+    delay = REGISTER_BACKOFF_INITIAL_SECONDS
     while True:
         try:
             ok = await register_with_gateway()
@@ -135,29 +195,29 @@ async def register_with_gateway_loop() -> None:
                 return
         except Exception as e:
             logger.warning(f"Gateway registration failed: {e!r}")
-        await asyncio.sleep(3)
+        await asyncio.sleep(random.uniform(delay / 2, delay))
+        delay = min(delay * 2, REGISTER_BACKOFF_MAX_SECONDS)
 
 
 async def heartbeat_loop() -> None:
     # Periodically send heartbeat and updates to the gateway.
     # This is how the gateway knows the station is alive.
     # Stagger startup to avoid thundering-herd heartbeat bursts.
-    await asyncio.sleep(random.randint(1, 15))
+    await asyncio.sleep(HEARTBEAT_STAGGER_SECONDS)
 
     while True:
         try:
             if not gateway_registered:
                 await asyncio.sleep(1)
                 continue
-            async with HTTP_CLIENT.session.post(
-                f"{GATEWAY_URL}/api/stations/{STATION_ID}/heartbeat",
-                json={},
-            ) as resp:
-                if resp.status == 404:
-                    logger.warning("Gateway lost station registration; re-registering.")
-                    await register_with_gateway()
-                    continue
-                resp.raise_for_status()
+            resp = await _post_retry(
+                f"{GATEWAY_URL}/api/stations/{STATION_ID}/heartbeat", {}
+            )
+            if resp.status == 404:
+                logger.warning("Gateway lost station registration; re-registering.")
+                await register_with_gateway()
+                continue
+            resp.raise_for_status()
             await notify_broker()
         except Exception as e:
             logger.warning(f"Heartbeat failed: {e!r}")
@@ -165,10 +225,11 @@ async def heartbeat_loop() -> None:
 
 
 @app.get("/state", response_model=StationState)
-async def get_state() -> StationState:
+async def get_state() -> ORJSONResponse:
     # Return the current station state.
     # Handy for debugging a single station directly.
-    return _build_station_state()
+    # Returned as a prebuilt dict; response_model is kept for the docs.
+    return ORJSONResponse(_station_payload())
 
 
 @app.post("/adjust")
@@ -192,7 +253,8 @@ async def apply_adjust(request: AdjustRequest) -> dict[str, Any]:
         )
     logger.info(last_event + f" (health {previous_health} -> {module_state.health})")
 
-    await notify_broker()
+    # Respond without waiting on the broker; the flusher sends the update.
+    broker_dirty.set()
     return {"ok": True, "health": module_state.health, "failed": module_state.failed}
 
 
@@ -204,6 +266,8 @@ def main() -> None:
         host="0.0.0.0",
         port=PORT,
         reload=False,
+        loop="uvloop",
+        http="httptools",
     )
 
 
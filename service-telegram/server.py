@@ -1,11 +1,14 @@
 import aiohttp
+import asyncio
 import os
+import time
 import uvicorn
 from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Any, Dict
-from vakula_common import HttpClient, setup_logger
+from vakula_common import HttpClient, post_json, setup_logger
 
 log = setup_logger("TELEGRAM")
 HTTP_CLIENT = HttpClient()
@@ -13,18 +16,82 @@ HTTP_CLIENT = HttpClient()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    HTTP_CLIENT.create_session(10)
+    # Create the shared session and, if batching is on, the flush task.
+    # Everything goes to api.telegram.org, so size the pool for that one host
+    # and keep its TLS connections (and DNS) around between bursts.
+    HTTP_CLIENT.create_session(
+        10,
+        limit=256,
+        limit_per_host=64,
+        keepalive_timeout=75,
+        ttl_dns_cache=300,
+    )
+    flush_task = asyncio.create_task(flush_loop()) if TELEGRAM_BATCH_ENABLED else None
     try:
         yield
     finally:
+        if flush_task is not None:
+            flush_task.cancel()
+            await asyncio.gather(flush_task, return_exceptions=True)
+            await flush_buffers()
         await HTTP_CLIENT.session.close()
 
 
-app = FastAPI(title="Vakula Telegram Notifier", lifespan=lifespan)
+app = FastAPI(
+    title="Vakula Telegram Notifier",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID", "")
+# The token is fixed for the process, so the Bot API URL is built once.
+SEND_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
 # https://stackoverflow.com/questions/32423837/telegram-bot-how-to-get-a-group-chat-id
+# Optional batching: queue messages per chat and send them joined on a timer.
+_batch_flag = os.environ.get("TELEGRAM_BATCH_ENABLED", "")
+TELEGRAM_BATCH_ENABLED = _batch_flag.lower() in {"1", "true", "yes"}
+TELEGRAM_BATCH_INTERVAL = float(os.environ.get("TELEGRAM_BATCH_INTERVAL", "3"))
+# Buffered characters per chat that trigger an early flush.
+TELEGRAM_MAX_BUFFER = int(os.environ.get("TELEGRAM_MAX_BUFFER", "16384"))
+# Telegram's sendMessage text limit.
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Pending batched messages keyed by (chat_id, parse_mode), with sizes.
+buffers: Dict[tuple[str, str | None], list[str]] = {}
+buffer_sizes: Dict[tuple[str, str | None], int] = {}
+flush_now = asyncio.Event()
+
+# Telegram allows ~30 messages/s per bot and ~1 message/s per chat.
+GLOBAL_RATE_PER_SECOND = 30
+CHAT_RATE_PER_SECOND = 1
+# Monotonic time until which all sends wait, set from a 429's retry_after.
+paused_until = 0.0
+
+
+class TokenBucket:
+    # Minimal async token bucket allowing `rate` acquisitions per second.
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                elapsed = now - self.updated
+                self.tokens = min(self.rate, self.tokens + elapsed * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+global_limiter = TokenBucket(GLOBAL_RATE_PER_SECOND)
+chat_limiters: Dict[str, TokenBucket] = {}
 
 
 class SendMessageRequest(BaseModel):
@@ -56,23 +123,105 @@ def _resolve_chat_id(request: SendMessageRequest) -> str:
     return chat_id
 
 
-@app.post("/api/send", response_model=SendMessageResponse)
-async def send_message(
-    request: SendMessageRequest,
-    token: str = Depends(_require_telegram_token),
-) -> SendMessageResponse:
+async def _post_message(
+    chat_id: str, text: str, parse_mode: str | None
+) -> Dict[Any, Any]:
+    # Single sendMessage call against the Telegram Bot API.
+    # Rate limited per chat and globally; a 429 pauses every sender for
+    # retry_after seconds and the message is retried once.
+    global paused_until
+    payload = {"chat_id": chat_id, "text": text}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    chat_limiter = chat_limiters.get(chat_id)
+    if chat_limiter is None:
+        chat_limiter = chat_limiters[chat_id] = TokenBucket(CHAT_RATE_PER_SECOND)
+    retried = False
+    while True:
+        delay = paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await chat_limiter.acquire()
+        await global_limiter.acquire()
+        async with post_json(HTTP_CLIENT.session, SEND_URL, payload) as resp:
+            if resp.status == 429 and not retried:
+                data = await resp.json(content_type=None)
+                retry_after = data.get("parameters", {}).get("retry_after", 1)
+                paused_until = max(paused_until, time.monotonic() + retry_after)
+                log.warning(f"Telegram rate limited; pausing {retry_after}s")
+                retried = True
+                continue
+            resp.raise_for_status()
+            return await resp.json()
+
+
+def _chunk_messages(messages: list[str]) -> list[str]:
+    # Join queued messages with newlines into texts of at most 4096 chars.
+    # A single oversized message is split on character boundaries.
+    chunks: list[str] = []
+    current = ""
+    for message in messages:
+        for start in range(0, max(len(message), 1), TELEGRAM_MESSAGE_LIMIT):
+            part = message[start : start + TELEGRAM_MESSAGE_LIMIT]
+            if current and len(current) + 1 + len(part) <= TELEGRAM_MESSAGE_LIMIT:
+                current = f"{current}\n{part}"
+            else:
+                if current:
+                    chunks.append(current)
+                current = part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def flush_buffers() -> None:
+    # Send everything queued so far, one sendMessage per chunk.
+    global buffers, buffer_sizes
+    pending, buffers, buffer_sizes = buffers, {}, {}
+    for (chat_id, parse_mode), messages in pending.items():
+        for text in _chunk_messages(messages):
+            try:
+                await _post_message(chat_id, text, parse_mode)
+            except Exception as e:
+                # Timeouts are not ClientErrors; one bad send must not
+                # drop the rest of the batch.
+                log.warning(f"Telegram batch send failed: {e!r}")
+
+
+async def flush_loop() -> None:
+    # Flush queued messages every interval, or early when a buffer fills up.
+    while True:
+        try:
+            await asyncio.wait_for(flush_now.wait(), timeout=TELEGRAM_BATCH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        flush_now.clear()
+        try:
+            await flush_buffers()
+        except Exception as e:
+            log.warning(f"Telegram flush failed: {e!r}")
+
+
+@app.post(
+    "/api/send",
+    response_model=SendMessageResponse,
+    dependencies=[Depends(_require_telegram_token)],
+)
+async def send_message(request: SendMessageRequest) -> SendMessageResponse:
     # Send a message to the Telegram Bot API.
     # This service is a thin wrapper around Telegram's HTTP endpoint.
+    # With batching on, the message is queued and sent by flush_loop.
     chat_id = _resolve_chat_id(request)
-    payload = {"chat_id": chat_id, "text": request.message}
-    if request.parse_mode:
-        payload["parse_mode"] = request.parse_mode
+    if TELEGRAM_BATCH_ENABLED:
+        key = (chat_id, request.parse_mode)
+        buffers.setdefault(key, []).append(request.message)
+        buffer_sizes[key] = buffer_sizes.get(key, 0) + len(request.message)
+        if buffer_sizes[key] >= TELEGRAM_MAX_BUFFER:
+            flush_now.set()
+        return SendMessageResponse(ok=True, telegram_response={"queued": True})
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
     try:
-        async with HTTP_CLIENT.session.post(url, json=payload) as resp:
-            resp.raise_for_status()
-            data = await resp.json()
+        data = await _post_message(chat_id, request.message, request.parse_mode)
     except aiohttp.ClientError as e:
         log.warning(f"Telegram send failed: {e!r}")
         raise HTTPException(status_code=502, detail="Telegram API request failed")
@@ -87,6 +236,8 @@ def main() -> None:
         host="0.0.0.0",
         port=int(os.environ["TELEGRAM_SERVICE_PORT"]),
         reload=False,
+        loop="uvloop",
+        http="httptools",
     )
 
 
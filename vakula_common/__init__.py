@@ -1,6 +1,6 @@
 """Shared helpers for Vakula services."""
 
-from vakula_common.http import HttpClient
+from vakula_common.http import JSON_HEADERS, HttpClient, post_json
 from vakula_common.logging import make_logger, setup_logger
 from vakula_common.models import AdjustRequest, ModuleState, StationState
 from vakula_common.modules import MODULE_IDS, module_name
@@ -8,10 +8,12 @@ from vakula_common.modules import MODULE_IDS, module_name
 __all__ = [
     "AdjustRequest",
     "HttpClient",
+    "JSON_HEADERS",
     "MODULE_IDS",
     "ModuleState",
     "StationState",
     "make_logger",
     "module_name",
+    "post_json",
     "setup_logger",
 ]
@@ -1,9 +1,37 @@
+from typing import Any
+
 import aiohttp
+import orjson
+
+# Pool defaults for every service session; callers override per upstream.
+# No per-host cap (aiohttp's 0): most services talk to a single upstream.
+CONNECTOR_DEFAULTS: dict[str, Any] = {
+    "limit": 100,
+    "keepalive_timeout": 30,
+}
+JSON_HEADERS = {"Content-Type": "application/json"}
 
 
 class HttpClient:
+    # One pooled session per process; callers must never open per-request
+    # sessions, or keep-alive connections are thrown away on every call.
     session: aiohttp.ClientSession
 
-    def create_session(self, timeout_seconds: int) -> None:
+    def create_session(self, timeout_seconds: int, **connector_kwargs: Any) -> None:
         timeout = aiohttp.ClientTimeout(total=timeout_seconds)
-        self.session = aiohttp.ClientSession(timeout=timeout)
+        connector = aiohttp.TCPConnector(**{**CONNECTOR_DEFAULTS, **connector_kwargs})
+        self.session = aiohttp.ClientSession(timeout=timeout, connector=connector)
+
+
+def post_json(
+    session: aiohttp.ClientSession,
+    url: str,
+    payload: Any,
+    *,
+    option: int | None = None,
+) -> Any:
+    # POST payload encoded with orjson (faster than aiohttp's json=).
+    # Returns aiohttp's request context manager: `async with post_json(...)`.
+    return session.post(
+        url, data=orjson.dumps(payload, option=option), headers=JSON_HEADERS
+    )